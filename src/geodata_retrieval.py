@@ -1,30 +1,169 @@
 import requests
-import xml.etree.ElementTree as ET
-import gzip
-from io import BytesIO
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+import lxml.etree as LET
+from io import BufferedReader, BytesIO
 import geopandas as gpd
-import pandas as pd
+import pyarrow as pa
+import pyogrio
 import pyproj
-from shapely.geometry import box
-from shapely.ops import transform
-from functools import partial
+import shapely
+from functools import lru_cache
 import os
+import shelve
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
 
 # CHOOSE PLACE TO DOWNLOAD TO
 output_dir = r"D:\PROJECTS\geodata_tool\downloads"
 os.makedirs(output_dir, exist_ok=True)
 
+# shared keep-alive session for all service requests; pooled connections are reused by
+# concurrent WFS page requests and transient server errors are retried with backoff
+session = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), raise_on_status=False)
+)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+# number of WFS pages requested in parallel
+max_workers = 8
+
+# default number of features per WFS page (limit of dutch requests), can be set per dataset with "count"
+default_count = 1000
+
+# CRS URNs in which features are requested: WGS84 lon/lat variants in order of preference,
+# then the dutch RD New, and WGS84 in latitude/longitude axis order as a last resort
+lonlat_crs = (
+    "urn:ogc:def:crs:OGC:1.3:CRS84",
+    "http://www.opengis.net/def/crs/OGC/1.3/CRS84",
+    "CRS:84"
+)
+wgs84_crs = "urn:ogc:def:crs:EPSG::4326"
+rd_new_crs = "urn:ogc:def:crs:EPSG::28992"
+
+# file formats in which WFS layers can be saved; GeoParquet is written by geopandas,
+# the others by pyogrio with the given driver
+output_formats = {
+    "fgb": {"label": "FlatGeobuf", "driver": "FlatGeobuf", "mime": "application/octet-stream"},
+    "geojson": {"label": "GeoJSON", "driver": "GeoJSON", "mime": "application/geo+json"},
+    "parquet": {"label": "GeoParquet", "driver": None, "mime": "application/vnd.apache.parquet"}
+}
+
+# GetCapabilities element whose Name children are the layers of each service type
+layer_elements = {
+    "WMS": "Layer",
+    "WFS": "FeatureType"
+}
+
+# headers sent with every WFS GetFeature request
+wfs_headers = {
+    "User-Agent": "Mozilla/5.0 QGIS/33411/Windows 11 Version 2009",
+    "Accept-Encoding": "gzip"
+}
+
+# on-disk caches (shelve files), guarded by one lock since Streamlit sessions run in threads
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+os.makedirs(cache_dir, exist_ok=True)
+cache_lock = threading.Lock()
+
+# GetCapabilities responses, revalidated with ETag / Last-Modified
+capabilities_cache = os.path.join(cache_dir, "capabilities")
+
+
+@lru_cache(maxsize=None)
+def get_transformer(from_epsg, to_epsg):
+    """Create (once per CRS pair) a transformer between two EPSG codes in x/y axis order."""
+    return pyproj.Transformer.from_crs(f"EPSG:{from_epsg}", f"EPSG:{to_epsg}", always_xy=True)
+
 
 def transform_bbox(bbox, from_epsg, to_epsg):
     """Transform a bbox from one CRS to another."""
     minx, miny, maxx, maxy = bbox
-    project = partial(
-        pyproj.transform,
-        pyproj.Proj(init=f'epsg:{from_epsg}'),
-        pyproj.Proj(init=f'epsg:{to_epsg}')
-    )
-    transformed = transform(project, box(minx, miny, maxx, maxy))
-    return transformed.bounds
+    return get_transformer(from_epsg, to_epsg).transform_bounds(minx, miny, maxx, maxy)
+
+@lru_cache(maxsize=64)
+def fetch_capabilities(capabilities_url):
+    """
+    Downloads a GetCapabilities document. Responses are stored on disk together with
+    their ETag and Last-Modified headers, so later runs send a conditional request and
+    reuse the stored document when the server answers 304 Not Modified. Within a run
+    the document is memoized per URL.
+
+    Parameters:
+        capabilities_url (str): The full GetCapabilities URL, including query parameters.
+
+    Returns:
+        bytes: The body of the GetCapabilities response.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails and no cached response is available.
+    """
+    with cache_lock, shelve.open(capabilities_cache) as cache:
+        cached = cache.get(capabilities_url)
+
+    headers = {}
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    try:
+        response = session.get(capabilities_url, headers=headers, timeout=10)
+        if response.status_code == 304 and cached:
+            return cached[2]
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        if cached:
+            logger.warning("Request failed, using cached capabilities: %s", e)
+            return cached[2]
+        raise
+
+    with cache_lock, shelve.open(capabilities_cache) as cache:
+        cache[capabilities_url] = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+            response.content
+        )
+
+    return response.content
+
+
+def parse_layer_names(content, container):
+    """
+    Streams a GetCapabilities document and collects the names of all elements of the given
+    type, in document order. Tags are matched in any namespace, and each container element
+    is cleared once it has been parsed to keep memory use flat for large documents.
+
+    Parameters:
+        content (bytes): The GetCapabilities XML document.
+        container (str): Local name of the elements whose Name to collect ("Layer" or "FeatureType").
+
+    Returns:
+        list: The text of the Name child of every matching element.
+
+    Raises:
+        lxml.etree.XMLSyntaxError: If the document is not valid XML.
+    """
+    names = []
+
+    for _, elem in LET.iterparse(BytesIO(content), events=("end",), tag=("{*}Name", f"{{*}}{container}")):
+        if LET.QName(elem).localname == container:
+            elem.clear()
+        elif LET.QName(elem.getparent()).localname == container:
+            names.append(elem.text)
+
+    return names
+
 
 def get_capabilities_layers(service_url, service_type):
     """
@@ -37,54 +176,67 @@ def get_capabilities_layers(service_url, service_type):
 
      Returns:
          list: A list of layer names (for WMS) or feature type names (for WFS)
-               available in the service, or an empty list if the request fails or no layers are found.
+               available in the service, or an empty list if the request fails, no layers are found
+               or the service type is neither WMS nor WFS.
 
      Raises:
          requests.exceptions.RequestException: If the request to the service fails.
-         xml.etree.ElementTree.ParseError: If the response is not valid XML.
+         lxml.etree.XMLSyntaxError: If the response is not valid XML.
      """
+    container = layer_elements.get(service_type.upper())
+    if container is None:
+        logger.debug("No GetCapabilities layers for service type %s", service_type)
+        return []
+
     capabilities_url = f"{service_url}?request=GetCapabilities&service={service_type}"
 
-    print(f"Fetching: {capabilities_url}")
+    logger.debug("Fetching: %s", capabilities_url)
 
     try:
-        response = requests.get(capabilities_url, timeout=10)
-        response.raise_for_status()
+        content = fetch_capabilities(capabilities_url)
 
-        if not response.text.strip().startswith("<"):
-            print("Error: Response is not XML. Received:", response.text[:200])
+        if not content.strip().startswith(b"<"):
+            logger.warning("Response is not XML. Received: %r", content[:200])
             return []
 
-        root = ET.fromstring(response.text)
-        layers = []
+        layers = parse_layer_names(content, container)
+        logger.debug("Layers of %s: %s", service_url, layers)
+        return layers
 
-        if service_type.upper() == "WMS":
-            for layer in root.findall(".//Layer/Name"):
-                layers.append(layer.text)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Request failed: %s", e)
+        return []
+    except LET.XMLSyntaxError:
+        logger.warning("Invalid XML response from server.")
+        return []
 
-            if not layers:
-                namespace = {"wms": "http://www.opengis.net/wms/1.3.0"}
-                for layer in root.findall(".//wms:Layer/wms:Name", namespaces=namespace):
-                    layers.append(layer.text)
 
-        elif service_type.upper() == "WFS":
-            for feature in root.findall(".//FeatureType/Name"):
-                layers.append(feature.text)
+@lru_cache(maxsize=32)
+def parse_supported_crs(wfs_url):
+    """
+    Parses the set of supported CRS from the GetCapabilities response of a WFS service.
+    Results are memoized per URL, so datasets sharing a service only query it once;
+    failures raise and are therefore not memoized.
 
-            if not layers:
-                namespace = {"wfs": "http://www.opengis.net/wfs/2.0"}
-                for feature in root.findall(".//wfs:FeatureType/wfs:Name", namespaces=namespace):
-                    layers.append(feature.text)
+    Parameters:
+        wfs_url (str): The base URL of the WFS service.
 
-        print(layers)
-        return layers
+    Returns:
+        frozenset: A set of CRS URNs supported by the service.
 
-    except requests.exceptions.RequestException as e:
-        print(f"Request failed: {e}")
-        return []
-    except ET.ParseError:
-        print("Error: Invalid XML response from server.")
-        return []
+    Raises:
+        requests.exceptions.RequestException: If the request fails and no cached response is available.
+        lxml.etree.XMLSyntaxError: If the response is not valid XML.
+    """
+    capabilities_url = f"{wfs_url}?service=WFS&version=2.0.0&request=GetCapabilities"
+    content = fetch_capabilities(capabilities_url)
+    crs_set = set()
+
+    for _, elem in LET.iterparse(BytesIO(content), events=("end",), tag=("{*}DefaultCRS", "{*}OtherCRS")):
+        crs_set.add(elem.text.strip())
+        elem.clear()
+
+    return frozenset(crs_set)
 
 
 def get_supported_crs(wfs_url):
@@ -92,65 +244,269 @@ def get_supported_crs(wfs_url):
     Retrieves the set of supported CRS (Coordinate Reference Systems) from a WFS service
     by parsing its GetCapabilities response.
 
+    Successful lookups are memoized per URL (see parse_supported_crs), a failed lookup
+    is retried on the next call.
+
     Parameters:
         wfs_url (str): The base URL of the WFS service.
 
     Returns:
-        set: A set of CRS URNs (e.g., "urn:ogc:def:crs:EPSG::4326") supported by the service,
-             or an empty set if the request fails or no CRS entries are found.
+        frozenset: A set of CRS URNs (e.g., "urn:ogc:def:crs:EPSG::4326") supported by the service,
+                   or an empty set if the request fails or no CRS entries are found.
 
     Raises:
         Exception: If there is a network or parsing error (caught and logged).
     """
-    params = {
-        "service": "WFS",
-        "version": "2.0.0",
-        "request": "GetCapabilities"
-    }
     try:
-        response = requests.get(wfs_url, params=params, timeout=10)
+        return parse_supported_crs(wfs_url)
+    except Exception as e:
+        logger.warning("CRS check failed: %s", e)
+        return frozenset()
+
+
+def select_request_crs(supported_crs, bbox):
+    """
+    Chooses the CRS in which features of a WFS service are requested and expresses the
+    bounding box in it. WGS84 in lon/lat axis order (CRS84) is preferred, so the returned
+    features do not have to be reprojected. Otherwise RD New (EPSG:28992) is used, which has
+    no axis order ambiguity, and only then the EPSG:4326 URN in latitude/longitude order.
+
+    Parameters:
+        supported_crs (frozenset): CRS URNs supported by the service (see get_supported_crs).
+        bbox (tuple): Bounding box as (minx, miny, maxx, maxy) in EPSG:4326.
+
+    Returns:
+        tuple: The CRS URN to request and the bounding box in that CRS's axis order.
+    """
+    for crs in lonlat_crs:
+        if crs in supported_crs:
+            return crs, tuple(bbox)
+
+    if rd_new_crs in supported_crs:
+        return rd_new_crs, transform_bbox(bbox, 4326, 28992)
+
+    minx, miny, maxx, maxy = bbox
+
+    # the EPSG:4326 URN uses latitude/longitude axis order
+    return wgs84_crs, (miny, minx, maxy, maxx)
+
+
+def get_feature_count(wfs_url, params):
+    """
+    Requests the number of features matching a WFS GetFeature query, using
+    resultType=hits (WFS 2.0).
+
+    Parameters:
+        wfs_url (str): The base URL of the WFS service.
+        params (dict): GetFeature parameters of the layer (see fetch_wfs_layer).
+
+    Returns:
+        int or None: The numberMatched reported by the server, or None if the request
+                     fails or the server does not report a count.
+    """
+    layer = params["TYPENAMES"]
+    hits_params = {**params, "RESULTTYPE": "hits"}
+
+    # hits are answered with an empty wfs:FeatureCollection, which only exists as XML, and
+    # must not be limited to a page, as some servers cap numberMatched at COUNT
+    del hits_params["OUTPUTFORMAT"]
+    del hits_params["COUNT"]
+
+    try:
+        response = session.get(wfs_url, params=hits_params, headers=wfs_headers, timeout=10)
         if response.status_code != 200:
-            print(f"Failed to get capabilities: {response.status_code}")
-            return set()
+            logger.warning("Failed to get feature count for %s: %s", layer, response.status_code)
+            return None
 
-        root = ET.fromstring(response.content)
-        ns = {'wfs': 'http://www.opengis.net/wfs/2.0'}
-        crs_set = set()
+        number_matched = LET.fromstring(response.content).get("numberMatched")
+        if number_matched is None or not number_matched.isdigit():
+            return None
 
-        for elem in root.iter():
-            if elem.tag.endswith("DefaultCRS") or elem.tag.endswith("OtherCRS"):
-                crs_set.add(elem.text.strip())
+        return int(number_matched)
+    except (requests.exceptions.RequestException, LET.XMLSyntaxError) as e:
+        logger.warning("Feature count for %s failed: %s", layer, e)
+        return None
 
-        return crs_set
-    except Exception as e:
-        print(f"CRS check failed: {e}")
-        return set()
 
+def fetch_wfs_page(wfs_url, params, start_index):
+    """
+    Downloads a single page of features of a WFS layer in GeoJSON format and reads it
+    into an Arrow table.
+
+    Parameters:
+        wfs_url (str): The base URL of the WFS service.
+        params (dict): GetFeature parameters of the layer (see fetch_wfs_layer).
+        start_index (int): Index of the first feature of the page.
+
+    Returns:
+        tuple or None: The pyogrio metadata and the Arrow table of the page, with the
+                       geometries as WKB, or None if the request fails or times out.
+    """
+    page_params = {**params, "STARTINDEX": start_index}
+
+    try:
+        # connect timeout, and a generous read timeout between chunks of large pages
+        with session.get(wfs_url, params=page_params, headers=wfs_headers, stream=True, timeout=(10, 300)) as response:
+            if response.status_code != 200:
+                logger.warning(
+                    "Failed to download WFS data. Status code: %s. Error message: %s",
+                    response.status_code, response.text
+                )
+                return None
+
+            # urllib3 decompresses gzip on the fly, so the body is never held compressed in memory
+            response.raw.decode_content = True
+            with BufferedReader(response.raw, buffer_size=256 * 1024) as f:
+                meta, table = pyogrio.read_arrow(f)
+                logger.debug("Layer %s returned %d features", params["TYPENAMES"], table.num_rows)
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+        # reading response.raw raises urllib3 errors rather than requests ones
+        logger.warning("Failed to download WFS data from index %d: %s", start_index, e)
+        return None
+
+    return meta, table
+
+
+def fetch_wfs_layer(wfs_url, layer, preferred_crs, bbox, count=default_count):
+    """
+    Downloads all features of a WFS layer within a bounding box.
+
+    When the server reports the number of matching features, exactly the pages needed
+    are requested in parallel, and no page is requested if nothing matches. Otherwise
+    pages are requested one after another until a page with fewer than `count`
+    features is returned.
+
+    Parameters:
+        wfs_url (str): The base URL of the WFS service.
+        layer (str): The feature type name to download.
+        preferred_crs (str): CRS URN in which the bounding box is given and the features are returned.
+        bbox (tuple): Bounding box as (minx, miny, maxx, maxy) in preferred_crs.
+        count (int): Number of features per page, at most the server's maximum page size.
+
+    Returns:
+        list of tuple: The downloaded pages as returned by fetch_wfs_page, in feature order.
+                       Pages that failed to download are left out; a layer with failed pages or
+                       fewer features than the server reported is logged as a warning.
+    """
+    minx, miny, maxx, maxy = bbox
+
+    # built once per layer, pages only add their STARTINDEX
+    params = {
+        "SERVICE": "WFS",
+        "REQUEST": "GetFeature",
+        "VERSION": "2.0.0",
+        "TYPENAMES": layer,
+        "SRSNAME": preferred_crs,
+        "BBOX": f"{minx},{miny},{maxx},{maxy},{preferred_crs}",
+        "COUNT": count,
+        "OUTPUTFORMAT": "application/json"
+    }
+
+    number_matched = get_feature_count(wfs_url, params)
+
+    if number_matched == 0:
+        return []
+
+    if number_matched is not None:
+        def fetch_page(start_index):
+            return fetch_wfs_page(wfs_url, params, start_index)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = list(executor.map(fetch_page, range(0, number_matched, count)))
+
+        failed_pages = pages.count(None)
+        pages = [page for page in pages if page is not None]
+        received = sum(table.num_rows for _, table in pages)
+
+        if failed_pages:
+            logger.warning(
+                "Layer %s is incomplete: %d of %d pages failed to download",
+                layer, failed_pages, failed_pages + len(pages)
+            )
+        elif received < number_matched:
+            # a server returning fewer features per page than requested leaves gaps between the offsets
+            logger.warning(
+                "Layer %s is incomplete: received %d of %d features, the page size (count=%d) "
+                "may exceed the server's maximum",
+                layer, received, number_matched, count
+            )
+
+        return pages
+
+    all_pages = []
+    start_index = 0
+
+    while True:
+        page = fetch_wfs_page(wfs_url, params, start_index)
+        if page is None:
+            break
+
+        all_pages.append(page)
+
+        if page[1].num_rows < count:
+            break
+
+        start_index += count
+
+    return all_pages
+
+
+def pages_to_geodataframe(pages):
+    """
+    Combines the Arrow tables of downloaded WFS pages into a single GeoDataFrame. The
+    tables are concatenated first, so the GeoDataFrame is only constructed once.
+
+    Parameters:
+        pages (list of tuple): Pages as returned by fetch_wfs_page.
+
+    Returns:
+        GeoDataFrame: All features of the pages, in the CRS reported by the first page.
+    """
+    meta = pages[0][0]
+
+    # pages may infer different column types (e.g. all-null columns), let Arrow unify them
+    table = pa.concat_tables([table for _, table in pages], promote_options="permissive")
+
+    df = table.to_pandas()
+    geometry = gpd.GeoSeries.from_wkb(df.pop(meta["geometry_name"] or "wkb_geometry"), crs=meta["crs"])
+
+    return gpd.GeoDataFrame(df, geometry=geometry)
 
-def fetch_geodata(selected_datasets, dataset_layers, datasets, bbox):
+
+def fetch_geodata(selected_datasets, dataset_layers, datasets, bbox, output_format="fgb", dataset_crs=None):
     """
      Fetches geospatial data for selected datasets and layers from WFS or WMS services
      within a given bounding box.
 
      For WFS layers, it downloads features in GeoJSON format (handling pagination),
-     reprojects to EPSG:4326 if necessary, and saves the result to disk.
+     reprojects to EPSG:4326 if necessary, and saves the result to disk in the chosen output format.
      For WMS layers, it constructs a GetMap URL for the bounding box.
 
      Parameters:
          selected_datasets (list of str): Names of datasets selected by the user.
          dataset_layers (dict): Mapping from dataset name to a list of layer names.
-         datasets (list of dict): Each dict should contain keys 'name', 'url', and 'type' ('WFS' or 'WMS').
+         datasets (list of dict): Each dict should contain keys 'name', 'url', and 'type' ('WFS' or 'WMS'),
+                                  and may set the WFS page size with 'count'.
          bbox (tuple): Bounding box as (minx, miny, maxx, maxy) in EPSG:4326.
+         output_format (str): Key of output_formats to save WFS layers as ('fgb', 'geojson' or 'parquet').
+         dataset_crs (dict, optional): Mapping from WFS dataset name to its supported CRS URNs, as
+                                       returned by get_supported_crs. Datasets missing from it, or
+                                       with an empty set, are queried when fetching.
 
      Returns:
          dict: A dictionary where keys are layer names and values contain:
                - type: 'WFS' or 'WMS'
-               - geojson and filename for WFS layers
+               - data (bytes of the saved file), filename and mime for WFS layers
                - URL for WMS layers
 
      Raises:
+         ValueError: If output_format is not a supported output format.
          requests.exceptions.RequestException: If any service request fails (caught and logged).
      """
+    if output_format not in output_formats:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    file_format = output_formats[output_format]
 
     minx, miny, maxx, maxy = bbox
     results = {}
@@ -158,82 +514,57 @@ def fetch_geodata(selected_datasets, dataset_layers, datasets, bbox):
     for dataset in datasets:
         if dataset["name"] in selected_datasets:
             layers = dataset_layers.get(dataset["name"], [])
-            supported_crs = get_supported_crs(dataset["url"])
 
-            from_epsg = 4326
-            to_epsg = 28992 if "urn:ogc:def:crs:EPSG::28992" in supported_crs else 4326
-            preferred_crs = f"urn:ogc:def:crs:EPSG::{to_epsg}"
+            if dataset["type"] == "WFS":
+                supported_crs = dataset_crs.get(dataset["name"]) if dataset_crs else None
+                if not supported_crs:
+                    supported_crs = get_supported_crs(dataset["url"])
 
-            if to_epsg != from_epsg:
-                minx, miny, maxx, maxy = transform_bbox(bbox, from_epsg, to_epsg)
+                preferred_crs, request_bbox = select_request_crs(supported_crs, bbox)
 
             for layer in layers:
                 if dataset["type"] == "WFS":
-                    all_features = []
-                    start_index = 0
-                    count = 1000  # limit of dutch requests
-
-                    while True:
-                        params = {
-                            "SERVICE": "WFS",
-                            "REQUEST": "GetFeature",
-                            "VERSION": "2.0.0",
-                            "TYPENAMES": layer,
-                            "SRSNAME": preferred_crs,
-                            "BBOX": f"{minx},{miny},{maxx},{maxy},{preferred_crs}",
-                            "COUNT": count,
-                            "STARTINDEX": start_index,
-                            "OUTPUTFORMAT": "application/json"
-                        }
-
-                        headers = {"User-Agent": "Mozilla/5.0 QGIS/33411/Windows 11 Version 2009"}
-                        response = requests.get(dataset["url"], params=params, headers=headers)
-
-                        if response.status_code == 200:
-                            if response.headers.get('Content-Encoding', '').lower() == 'gzip' and response.content[:2] == b'\x1f\x8b':
-                                data = gzip.decompress(response.content)
-                            else:
-                                data = response.content
-
-                            with BytesIO(data) as f:
-                                gdf = gpd.read_file(f)
-                                print(f"Layer {layer} returned {len(gdf)} features")
-
-                            all_features.append(gdf)
-
-                            if len(gdf) < count:
-                                break
+                    pages = fetch_wfs_layer(
+                        dataset["url"], layer, preferred_crs, request_bbox, dataset.get("count", default_count)
+                    )
 
-                            start_index += count
+                    if pages:
+                        full_gdf = pages_to_geodataframe(pages)
+
+                        # go by the CRS the server returned, it may have ignored SRSNAME
+                        if preferred_crs in lonlat_crs and full_gdf.crs in ("EPSG:4326", "OGC:CRS84"):
+                            # already in WGS84 lon/lat, only the CRS label may differ
+                            full_gdf = full_gdf.set_crs("EPSG:4326", allow_override=True)
+                        elif preferred_crs == wgs84_crs and full_gdf.crs == "EPSG:4326":
+                            # the server is assumed to follow the URN's lat/lon axis order,
+                            # which GDAL reads as x/y, so swap the coordinates to lon/lat
+                            swapped = shapely.transform(full_gdf.geometry.values, lambda coords: coords[:, ::-1])
+                            full_gdf = full_gdf.set_geometry(gpd.GeoSeries(swapped, index=full_gdf.index, crs="EPSG:4326"))
                         else:
-                            print(f"Failed to download WFS data. Status code: {response.status_code}")
-                            print(f"Error message: {response.text}")
-                            break
-
-                    if all_features:
-                        full_gdf = gpd.GeoDataFrame(pd.concat(all_features, ignore_index=True))
-
-                        if full_gdf.crs != "EPSG:4326":
                             full_gdf = full_gdf.to_crs("EPSG:4326")
 
-                        full_gdf = full_gdf[full_gdf.geometry.notnull()]
-                        full_gdf = full_gdf[full_gdf.is_valid]
+                        # drop missing and invalid geometries in a single vectorized pass
+                        geometries = full_gdf.geometry.values
+                        full_gdf = full_gdf[~shapely.is_missing(geometries) & shapely.is_valid(geometries)]
 
-                        filename = os.path.join(output_dir, f"{layer.replace(':', '_')}_4326.geojson")
-                        full_gdf.to_file(filename, driver='GeoJSON')
+                        filename = os.path.join(output_dir, f"{layer.replace(':', '_')}_4326.{output_format}")
+                        if file_format["driver"] is None:
+                            full_gdf.to_parquet(filename)
+                        else:
+                            pyogrio.write_dataframe(full_gdf, filename, driver=file_format["driver"])
 
-                        for col in full_gdf.columns:
-                            if pd.api.types.is_datetime64_any_dtype(full_gdf[col]):
-                                full_gdf[col] = full_gdf[col].astype(str)
+                        # serve the written file instead of serializing the layer a second time
+                        with open(filename, "rb") as fh:
+                            data = fh.read()
 
-                        geojson = full_gdf.to_json()
                         results[layer] = {
                             "type": "WFS",
-                            "geojson": geojson,
-                            "filename": filename
+                            "data": data,
+                            "filename": filename,
+                            "mime": file_format["mime"]
                         }
 
-                        print(f"Saved {layer} to {filename}")
+                        logger.debug("Saved %s to %s", layer, filename)
 
                 elif dataset["type"] == "WMS":
                     wms_url = (
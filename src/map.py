@@ -7,9 +7,15 @@ from streamlit_folium import st_folium
 from folium.plugins import Draw
 import json
 import requests
-from geodata_retrieval import get_capabilities_layers, fetch_geodata
+from geodata_retrieval import (
+    get_capabilities_layers, get_supported_crs, fetch_geodata, output_formats, cache_dir, cache_lock
+)
 import sys
 import csv
+import os
+import shelve
+import hashlib
+import time
 
 # ensure max table size for windows is not reached
 if sys.platform != "win32":
@@ -22,6 +28,9 @@ else:
 with open(r"D:\PROJECTS\geodata_tool\data\datasets.json") as f:
     datasets = json.load(f)["datasets"]
 
+# ellipsoid used to turn the point radius (in meters) into a bounding box
+geod = pyproj.Geod(ellps="WGS84")
+
 
 # ============ Streamlit folium website parts ==========
 st.title('Geodata Downloader')
@@ -40,15 +49,53 @@ selected_datasets = st.multiselect(
     options=[ds["name"] for ds in datasets]
 )
 
+output_format = st.selectbox(
+    "Output format",
+    options=list(output_formats),
+    format_func=lambda key: output_formats[key]["label"]
+)
+
+# layers are also kept on disk for a day, so restarting the app does not query every service again
+layers_cache = os.path.join(cache_dir, "dataset_layers")
+layers_cache_expiry = 24 * 60 * 60
+
 @st.cache_data
 def get_all_dataset_layers(datasets):
-    return {
+    key = hashlib.sha1(json.dumps(datasets, sort_keys=True).encode()).hexdigest()
+
+    with cache_lock, shelve.open(layers_cache) as cache:
+        cached = cache.get(key)
+    if cached and time.time() - cached[0] < layers_cache_expiry:
+        return cached[1]
+
+    dataset_layers = {
         dataset["name"]: get_capabilities_layers(dataset["url"], dataset["type"])
         for dataset in datasets
     }
 
+    # do not persist a failed lookup of a WMS/WFS service for a whole day
+    if all(dataset_layers[dataset["name"]] for dataset in datasets if dataset["type"] in ("WMS", "WFS")):
+        with cache_lock, shelve.open(layers_cache) as cache:
+            cache[key] = (time.time(), dataset_layers)
+
+    return dataset_layers
+
 dataset_layers = get_all_dataset_layers(datasets)
 
+# supported CRSs of the WFS datasets, looked up once instead of on every "Fetch Data" press
+@st.cache_data
+def get_all_supported_crs(datasets):
+    dataset_crs = {
+        dataset["name"]: get_supported_crs(dataset["url"])
+        for dataset in datasets
+        if dataset["type"] == "WFS"
+    }
+
+    # leave failed lookups out, so fetch_geodata queries those services again
+    return {name: supported_crs for name, supported_crs in dataset_crs.items() if supported_crs}
+
+dataset_crs = get_all_supported_crs(datasets)
+
 bbox = None
 
 radius = st.number_input('Enter radius (in meters) for the point:', min_value=0, value=1500)
@@ -74,12 +121,10 @@ if map_data and 'all_drawings' in map_data and map_data['all_drawings']:
             st.write(f"Point Coordinates: {drawn_geo.x}, {drawn_geo.y}")
 
             # Convert point to a bounding box using the radius
-            # Convert the radius to degrees (approximate, lat/lon)
-            radius_in_degrees = radius / 111320
-            minx = drawn_geo.x - radius_in_degrees
-            miny = drawn_geo.y - radius_in_degrees
-            maxx = drawn_geo.x + radius_in_degrees
-            maxy = drawn_geo.y + radius_in_degrees
+            # Walk the radius north, east, south and west on the WGS84 ellipsoid in one call
+            lons, lats, _ = geod.fwd([drawn_geo.x] * 4, [drawn_geo.y] * 4, [0, 90, 180, 270], [radius] * 4)
+            minx, maxx = lons[3], lons[1]
+            miny, maxy = lats[2], lats[0]
 
             st.write(f"Generated Bounding Box Coordinates: {minx}, {miny}, {maxx}, {maxy}")
             bbox = [minx, miny, maxx, maxy]
@@ -87,11 +132,14 @@ if map_data and 'all_drawings' in map_data and map_data['all_drawings']:
             st.error("The drawn geometry is not a Point.")
 
     try:
-        crs = pyproj.CRS.from_string(crs_code)
-        transformer = pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+        # reuse the transformer across reruns as long as the CRS code does not change
+        transformers = st.session_state.setdefault("transformers", {})
+        if crs_code not in transformers:
+            crs = pyproj.CRS.from_string(crs_code)
+            transformers[crs_code] = pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+        transformer = transformers[crs_code]
 
-        minx_t, miny_t = transformer.transform(minx, miny)
-        maxx_t, maxy_t = transformer.transform(maxx, maxy)
+        minx_t, miny_t, maxx_t, maxy_t = transformer.transform_bounds(minx, miny, maxx, maxy, densify_pts=21)
 
         st.write(f"Transformed Bounding Box ({crs_code}): {minx_t}, {miny_t}, {maxx_t}, {maxy_t}")
 
@@ -106,14 +154,14 @@ with c1:
 with c2:
     if bbox and selected_datasets:
         if st.button("Fetch Data"):
-            results = fetch_geodata(selected_datasets, dataset_layers, datasets, bbox)
+            results = fetch_geodata(selected_datasets, dataset_layers, datasets, bbox, output_format, dataset_crs)
 
             # Download the selected WFS data
             for layer, data in results.items():
                 if data["type"] == "WFS":
                     st.download_button(
-                        label=f"Download {layer} as GeoJSON",
-                        data=data["geojson"],
+                        label=f"Download {layer} as {output_formats[output_format]['label']}",
+                        data=data["data"],
                         file_name=data["filename"],
-                        mime="application/geo+json"
+                        mime=data["mime"]
                     )
\ No newline at end of file